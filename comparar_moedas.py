@@ -3,51 +3,98 @@
 Script para comparar moedas e quantidades entre ficheiros Excel (ucoin.xlsx e numista.xls)
 """
 
+import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
 
+try:
+    from numba import njit, prange
+except ImportError:
+    # Numba é opcional: sem ele o matching corre as mesmas funções em Python
+    njit = None
+    prange = range
 
-def write_excel_with_hyperlinks(df, filename, link_column="link_numista"):
-    """Write DataFrame to Excel with clickable hyperlinks"""
-    # First write the dataframe normally
-    df.to_excel(filename, index=False)
 
-    # Then load the workbook and convert links to hyperlinks
-    wb = load_workbook(filename)
-    ws = wb.active
-
-    # Find the column index for the link column
-    headers = [cell.value for cell in ws[1]]
-    if link_column in headers:
-        link_col_idx = headers.index(link_column) + 1
+def ler_cache_parquet(ficheiro):
+    """
+    Lê a cópia Parquet do ficheiro Excel (ficheiro + ".parquet"), se existir e for
+    mais recente que o Excel. Retorna None se não houver cache válida.
+    """
+    cache = ficheiro + ".parquet"
+    try:
+        if os.path.getmtime(cache) < os.path.getmtime(ficheiro):
+            return None
+        return pd.read_parquet(cache, engine="pyarrow")
+    except Exception:
+        # Sem cache, cache desatualizada/corrompida ou pyarrow não instalado
+        return None
 
-        # Convert URLs to hyperlinks (starting from row 2, skipping header)
-        for row in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row, column=link_col_idx)
-            if cell.value and str(cell.value).startswith("http"):
-                url = str(cell.value)
-                cell.hyperlink = url
-                cell.style = "Hyperlink"
 
-    wb.save(filename)
+def guardar_cache_parquet(df, ficheiro):
+    """Guarda uma cópia Parquet do DataFrame para acelerar as próximas execuções"""
+    cache = ficheiro + ".parquet"
+    try:
+        df.to_parquet(cache, engine="pyarrow", index=False)
+    except Exception:
+        # pyarrow não instalado ou colunas com tipos mistos: seguir sem cache
+        if os.path.exists(cache):
+            os.remove(cache)
 
 
 def carregar_excel(ficheiro):
     """Carrega o ficheiro Excel e retorna um DataFrame"""
-    try:
-        if ficheiro.endswith(".xlsx"):
-            df = pd.read_excel(ficheiro, engine="openpyxl")
-        else:
-            df = pd.read_excel(ficheiro)
+    df = ler_cache_parquet(ficheiro)
+    if df is not None:
         return df
+
+    try:
+        try:
+            # python-calamine é bastante mais rápido que o openpyxl
+            df = pd.read_excel(ficheiro, engine="calamine")
+        except (ImportError, ValueError):
+            # Não instalado, ou versão do pandas sem o motor calamine
+            if ficheiro.endswith(".xlsx"):
+                df = pd.read_excel(ficheiro, engine="openpyxl")
+            else:
+                df = pd.read_excel(ficheiro)
     except Exception as e:
         print(f"Erro ao carregar {ficheiro}: {e}")
         sys.exit(1)
 
+    guardar_cache_parquet(df, ficheiro)
+    return df
+
+
+def reduzir_tipos(df):
+    """
+    Converte as colunas usadas na comparação para tipos mais pequenos: anos e
+    quantidades para Int32, diâmetros para float32 e os nomes para category
+    (o groupby passa a trabalhar com os códigos inteiros das categorias)
+    """
+    df = df.copy()
+    for col in ["ano", "ano gregoriano", "quantidade"]:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+            try:
+                df[col] = df[col].astype("Int32")
+            except (TypeError, ValueError):
+                pass  # Valores não inteiros: manter a coluna como está
+
+    for col in ["diâmetro", "diametro, mm"]:
+        if col in df.columns and pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype("float32")
+
+    for col in ["país", "emissor", "denominação", "título"]:
+        if col in df.columns and pd.api.types.infer_dtype(df[col]) == "string":
+            df[col] = df[col].astype("category")
+
+    return df
+
 
 def criar_chave_moeda(row, tipo):
     """Cria uma chave única para cada moeda baseada em múltiplos campos"""
@@ -70,67 +117,439 @@ def criar_chave_moeda(row, tipo):
         return None
 
 
-def normalizar_para_comparacao(s):
-    """Normaliza string para comparação (remove acentos, maiúsculas, etc)"""
-    if pd.isna(s):
-        return ""
-    s = str(s).lower().strip()
-    # Remover caracteres especiais
-    s = s.replace("ã", "a").replace("á", "a").replace("à", "a")
-    s = s.replace("é", "e").replace("ê", "e")
-    s = s.replace("í", "i")
-    s = s.replace("ó", "o").replace("õ", "o").replace("ô", "o")
-    s = s.replace("ú", "u").replace("ü", "u")
-    s = s.replace("ç", "c")
+# Expressões regulares compiladas uma única vez
+_NUM_RE = re.compile(r"\d+\.?\d*")
+_DIAM_RE = re.compile(r"(\d+\.?\d*)")
+_KM_A_RE = re.compile(r"(KM#|Y#)\s*A(\d+)")
+_NAO_DIGITOS_RE = re.compile(r"\D")
+
+URL_NUMISTA = "https://pt.numista.com/"
+
+# Tabela para remover acentos numa única passagem (str.translate)
+_TABELA_ACENTOS = str.maketrans(
+    {
+        "ã": "a",
+        "á": "a",
+        "à": "a",
+        "é": "e",
+        "ê": "e",
+        "í": "i",
+        "ó": "o",
+        "õ": "o",
+        "ô": "o",
+        "ú": "u",
+        "ü": "u",
+        "ç": "c",
+    }
+)
+
+
+def normalizar_series(s):
+    """Normaliza uma coluna inteira para comparação (remove acentos, maiúsculas, etc)"""
+    s = s.astype("string").fillna("").str.lower().str.strip()
+    s = s.str.translate(_TABELA_ACENTOS)
 
     # Normalizar variações comuns de nomes de países
-    if "united states" in s or "estados unidos" in s or s == "usa":
-        return "usa"
-    if "soviet union" in s or "uniao sovietica" in s or s == "ussr" or s == "urss":
-        return "ussr"
-
+    s = s.mask(s.str.contains("united states|estados unidos") | s.eq("usa"), "usa")
+    s = s.mask(
+        s.str.contains("soviet union|uniao sovietica") | s.isin(["ussr", "urss"]),
+        "ussr",
+    )
     return s
 
 
+def obter_coluna(df, coluna):
+    """Devolve a coluna do DataFrame (ou uma coluna vazia se não existir)"""
+    if coluna not in df.columns:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    return df[coluna]
+
+
+def coluna_normalizada(df, coluna):
+    """Devolve a coluna normalizada como array (vazio se a coluna não existir)"""
+    return normalizar_series(obter_coluna(df, coluna)).to_numpy(dtype=object)
+
+
 def normalizar_referencia(ref):
     """Normaliza referência de catálogo para comparação"""
-    if pd.isna(ref):
-        return ""
-    ref = str(ref).strip().upper()
+    return _normalizar_ref("" if pd.isna(ref) else str(ref))
+
+
+# As mesmas referências repetem-se muitas vezes nos catálogos: guardar em cache
+# o resultado já calculado para cada texto
+@lru_cache(maxsize=4096)
+def _normalizar_ref(ref):
+    ref = ref.strip().upper()
     # Remover espaços e normalizar separadores
     ref = ref.replace(" ", "")
     # Remover letras variantes que podem aparecer (e.g., KM# A192 -> KM#192)
     # Mas manter letras no final (e.g., KM# 164a)
-    import re
-
-    # Match pattern like KM# A123 and convert to KM#123
-    ref = re.sub(r"(KM#|Y#)\s*A(\d+)", r"\1\2", ref)
+    ref = _KM_A_RE.sub(r"\1\2", ref)
     return ref
 
 
-def extrair_numeros(texto):
-    """Extrai apenas os números de um texto"""
-    if pd.isna(texto):
-        return ""
-    import re
+def extrair_numeros_series(s):
+    """Extrai apenas os números de cada texto de uma coluna"""
+    return s.astype("string").str.findall(_NUM_RE).str.join("").fillna("")
 
-    numeros = re.findall(r"\d+\.?\d*", str(texto))
-    return "".join(numeros)
 
+def extrair_diametro_series(s):
+    """Extrai o valor numérico do diâmetro de cada texto (NaN quando não há diâmetro)"""
+    diametros = s.astype("string").str.extract(_DIAM_RE, expand=False)
+    return pd.to_numeric(diametros, errors="coerce").astype(np.float64)
 
-def extrair_diametro(diametro_str):
-    """Extrai o valor numérico do diâmetro"""
-    if pd.isna(diametro_str):
-        return None
-    import re
 
-    match = re.search(r"(\d+\.?\d*)", str(diametro_str))
-    if match:
-        try:
-            return float(match.group(1))
-        except:
-            return None
-    return None
+def links_numista(numeros):
+    """Constrói os links para o Numista a partir dos números N# (com link)"""
+    # Extract only digits from the string
+    digitos = numeros.astype("string").str.replace(_NAO_DIGITOS_RE, "", regex=True)
+    digitos = digitos.fillna("")
+    return (URL_NUMISTA + digitos).where(digitos != "", "").astype(object)
+
+
+# Ano em falta/inválido nos arrays de anos (o ano 0 não existe)
+SEM_ANO = 0
+
+
+def como_inteiros(s):
+    """Converte uma coluna para inteiros (Int64), com <NA> nos valores vazios ou inválidos"""
+    numeros = pd.to_numeric(s.astype("string").str.strip(), errors="coerce")
+    numeros = numeros.astype("Float64").mask(np.isinf(numeros), pd.NA)
+    return np.trunc(numeros).astype("Int64")
+
+
+def anos_como_array(s):
+    """Converte uma coluna de anos para um array int64 (SEM_ANO se vazio ou inválido)"""
+    return como_inteiros(s).to_numpy(dtype=np.int64, na_value=SEM_ANO)
+
+
+def valor_canonico(valor_num):
+    """
+    Normaliza o valor de face para comparação (converter decimais para inteiros se possível)
+    Ex: "0.05" -> "5" (5 centavos), "0.5" -> "50" (50 centavos), "1.0" -> "1"
+    """
+    if not valor_num:
+        return valor_num
+    try:
+        val_float = float(valor_num)
+        if val_float < 1.0:
+            # É centavos/céntimos - multiplicar por 100
+            return str(int(val_float * 100))
+        # É unidade inteira
+        return str(int(val_float))
+    except (ValueError, OverflowError):
+        return valor_num
+
+
+def caracteristicas_ucoin(df):
+    """
+    Extrai uma única vez as características usadas no matching de cada moeda do uCoin.
+    Retorna listas/arrays paralelos, indexados pela posição da linha no DataFrame.
+    """
+    paises = coluna_normalizada(df, "país")
+
+    # Para moedas de Espanha, o ano real pode estar na coluna var. (ano dentro da estrela)
+    # O ano correto é "19" + var. (ex: var. = 77 → ano = 1977)
+    # Para outras moedas (ou var. inválido), usar o ano normal
+    var_num = anos_como_array(obter_coluna(df, "var."))
+    espanha = pd.Series(paises, dtype=object).str.contains("espanha").to_numpy()
+    anos = np.where(
+        espanha & (var_num != SEM_ANO),
+        1900 + var_num,
+        anos_como_array(obter_coluna(df, "ano")),
+    )
+
+    return {
+        "pais": paises,
+        "ano": anos,
+        "diametro": extrair_diametro_series(
+            obter_coluna(df, "diametro, mm")
+        ).to_numpy(),
+        "valor": extrair_numeros_series(obter_coluna(df, "denominação")).tolist(),
+        "ref": [normalizar_referencia(ref) for ref in obter_coluna(df, "número")],
+    }
+
+
+def caracteristicas_numista(df):
+    """
+    Extrai uma única vez as características usadas no matching de cada moeda do Numista.
+    Retorna listas/arrays paralelos, indexados pela posição da linha no DataFrame.
+    """
+    # Tentar ambos os anos: "ano" e "ano gregoriano"
+    anos = anos_como_array(obter_coluna(df, "ano"))
+    anos_alt = anos_como_array(obter_coluna(df, "ano gregoriano"))
+
+    # Se não temos ano, usar o alternativo
+    sem_ano = anos == SEM_ANO
+    anos = np.where(sem_ano, anos_alt, anos)
+    anos_alt = np.where(sem_ano, SEM_ANO, anos_alt)
+
+    valores = extrair_numeros_series(obter_coluna(df, "valor de face"))
+    return {
+        "emissor": coluna_normalizada(df, "emissor"),
+        "pais": coluna_normalizada(df, "país"),
+        "ano": anos,
+        "ano_alt": anos_alt,  # Ano alternativo para verificação
+        # Usar 'diâmetro' em vez de 'diametro, mm'
+        "diametro": extrair_diametro_series(obter_coluna(df, "diâmetro")).to_numpy(),
+        "valor": [valor_canonico(valor) for valor in valores],
+        "ref": [normalizar_referencia(ref) for ref in obter_coluna(df, "referência")],
+    }
+
+
+def matriz_contencao(textos1, textos2, bloco=1024):
+    """
+    Matriz booleana M[a, b]: textos1[a] e textos2[b] não são vazios e um contém o
+    outro (qualquer direção, o que inclui o match exato). Calculada com
+    numpy.char.find por blocos de linhas, para limitar a memória usada.
+    """
+    textos1 = np.asarray(textos1, dtype=str)
+    textos2 = np.asarray(textos2, dtype=str)[None, :]
+
+    matriz = np.zeros((len(textos1), textos2.shape[1]), dtype=np.bool_)
+    for inicio in range(0, len(textos1), bloco):
+        a = textos1[inicio : inicio + bloco, None]
+        matriz[inicio : inicio + bloco] = (np.char.find(textos2, a) >= 0) | (
+            np.char.find(a, textos2) >= 0
+        )
+
+    matriz &= (np.char.str_len(textos1) > 0)[:, None]
+    matriz &= np.char.str_len(textos2) > 0
+    return matriz
+
+
+# Relação entre dois textos (valor ou referência) de um par candidato
+REL_NENHUMA = 0
+REL_PARCIAL = 1  # Um contém o outro
+REL_IGUAL = 2
+REL_VAZIOS = 3  # Ambos sem valor
+
+
+def fatorizar(*colunas):
+    """
+    Codifica os textos de várias colunas com pd.factorize sobre a união de todas,
+    para que textos iguais tenham o mesmo código int32 em qualquer coluna.
+    Textos vazios ficam com o código -1.
+    Retorna a lista de arrays de códigos (um por coluna) e os textos únicos.
+    """
+    uniao = pd.Series(np.concatenate([np.asarray(c, dtype=object) for c in colunas]))
+    codigos, unicos = pd.factorize(uniao.replace("", None))
+    limites = np.cumsum([len(c) for c in colunas])[:-1]
+    return np.split(codigos.astype(np.int32), limites), np.asarray(unicos, dtype=object)
+
+
+def relacao_textos(textos1, textos2, i_idx, j_idx):
+    """
+    Calcula a relação (REL_*) entre textos1[i] e textos2[j] para cada par candidato.
+    Igualdade e textos vazios são comparações de códigos inteiros (ver fatorizar);
+    o teste de contenção só corre uma vez por cada combinação distinta de textos.
+    """
+    (codigos1, codigos2), unicos = fatorizar(textos1, textos2)
+    codigos1 = codigos1[i_idx]
+    codigos2 = codigos2[j_idx]
+
+    vazio1 = codigos1 < 0
+    vazio2 = codigos2 < 0
+    relacoes = np.full(len(i_idx), REL_NENHUMA, dtype=np.int8)
+    relacoes[vazio1 & vazio2] = REL_VAZIOS
+    relacoes[~vazio1 & (codigos1 == codigos2)] = REL_IGUAL
+
+    # Textos diferentes, ambos preenchidos: verificar se um contém o outro
+    # (cada combinação de códigos é empacotada numa única chave int64)
+    diferentes = np.flatnonzero(~vazio1 & ~vazio2 & (codigos1 != codigos2))
+    combinacoes, inversa = np.unique(
+        codigos1[diferentes].astype(np.int64) * len(unicos) + codigos2[diferentes],
+        return_inverse=True,
+    )
+    parciais = np.array(
+        [
+            unicos[cod1] in unicos[cod2] or unicos[cod2] in unicos[cod1]
+            for cod1, cod2 in (divmod(int(chave), len(unicos)) for chave in combinacoes)
+        ],
+        dtype=np.bool_,
+    )
+    relacoes[diferentes[parciais[inversa.ravel()]]] = REL_PARCIAL
+    return relacoes
+
+
+def pontuar_pares(
+    i_idx,
+    j_idx,
+    paises1,
+    emissores2,
+    paises2,
+    compatibilidade,
+    diametros1,
+    diametros2,
+    rel_valor,
+    rel_ref,
+):
+    """
+    Calcula o score de cada par candidato (i_idx[k], j_idx[k]).
+    Só usa arrays numéricos, para poder ser compilado com Numba.
+    Pares que falham um critério obrigatório ficam com score 0.
+    """
+    scores = np.zeros(len(i_idx), dtype=np.int64)
+    for k in prange(len(i_idx)):
+        i = i_idx[k]
+        j = j_idx[k]
+
+        # 1. País deve ser igual (com flexibilidade para variações de nome):
+        # o país do uCoin e o emissor ou o país do Numista contêm-se um ao outro
+        # (código -1 = nome vazio)
+        pais1 = paises1[i]
+        emissor2 = emissores2[j]
+        pais2 = paises2[j]
+        if pais1 < 0 or not (
+            (emissor2 >= 0 and compatibilidade[pais1, emissor2])
+            or (pais2 >= 0 and compatibilidade[pais1, pais2])
+        ):
+            continue  # OBRIGATÓRIO
+
+        # 2. Ano deve ser igual: garantido pelo índice por ano
+
+        # Se chegou aqui, passou nos critérios obrigatórios (país + ano)
+        score = 100  # Base score para critérios obrigatórios
+
+        # 3. Bonus/penalidade por diâmetro (se ambos disponíveis)
+        dif_diametro = abs(diametros1[i] - diametros2[j])
+        if not np.isnan(dif_diametro):
+            if dif_diametro <= 0.5:
+                score += 100  # Diâmetro quase igual - PESO MUITO ALTO
+            elif dif_diametro <= 1.0:
+                score += 70  # Diâmetro próximo
+            elif dif_diametro <= 2.0:
+                score += 40  # Diâmetro aceitável
+            elif dif_diametro <= 3.5:
+                score += 10  # Diâmetro razoável
+            else:
+                # Diâmetro muito diferente - grande penalidade
+                score -= 100  # Penalidade forte
+
+        # 4. Comparar valor (apenas números) - PESO ALTO
+        if rel_valor[k] == REL_IGUAL:
+            score += 150  # Match perfeito do valor
+        elif rel_valor[k] == REL_PARCIAL:
+            score += 50  # Match parcial
+        elif rel_valor[k] == REL_VAZIOS:
+            # Ambos sem valor numérico (raro mas possível)
+            score += 80
+
+        # 5. Comparar referência de catálogo (se disponível)
+        if rel_ref[k] == REL_IGUAL:
+            score += 200  # Match perfeito de referência - PESO MUITO ALTO
+        elif rel_ref[k] == REL_PARCIAL:
+            score += 80  # Match parcial de referência
+
+        scores[k] = score
+    return scores
+
+
+def escolher_matches(i_idx, j_idx, scores, n1, n2):
+    """
+    Escolhe, para cada moeda do uCoin (pela ordem do df1), o candidato com maior
+    score que ainda não foi usado. Os pares têm de vir agrupados por i e, dentro
+    de cada i, pela ordem do df2 (em caso de empate fica o primeiro).
+    """
+    melhor_j = np.full(n1, -1, dtype=np.int64)
+    melhor_score = np.zeros(n1, dtype=np.int64)
+    usado = np.zeros(n2, dtype=np.bool_)  # Evitar duplicados
+
+    k = 0
+    while k < len(i_idx):
+        i = i_idx[k]
+        while k < len(i_idx) and i_idx[k] == i:
+            j = j_idx[k]
+            if not usado[j] and scores[k] > melhor_score[i]:
+                melhor_score[i] = scores[k]
+                melhor_j[i] = j
+            k += 1
+        if melhor_j[i] >= 0:
+            usado[melhor_j[i]] = True
+
+    return melhor_j, melhor_score
+
+
+if njit is not None:
+    pontuar_pares = njit(parallel=True, cache=True)(pontuar_pares)
+    escolher_matches = njit(cache=True)(escolher_matches)
+
+
+# Sem Numba, acima deste número de pares candidatos a pontuação é
+# distribuída por vários processos (se houver mais de um CPU)
+LIMIAR_PARALELO = 10**6
+
+# Argumentos de pontuar_pares partilhados com cada processo (ver _iniciar_processo)
+_argumentos_processo = ()
+
+
+def _iniciar_processo(argumentos):
+    global _argumentos_processo
+    _argumentos_processo = argumentos
+
+
+def _pontuar_bloco(limites):
+    """Pontua os pares candidatos [inicio, fim) num processo auxiliar"""
+    inicio, fim = limites
+    i_idx, j_idx, *caracteristicas, rel_valor, rel_ref = _argumentos_processo
+    return pontuar_pares(
+        i_idx[inicio:fim],
+        j_idx[inicio:fim],
+        *caracteristicas,
+        rel_valor[inicio:fim],
+        rel_ref[inicio:fim],
+    )
+
+
+def pontuar_pares_em_paralelo(argumentos):
+    """
+    Igual a pontuar_pares(*argumentos), mas divide os pares candidatos em blocos
+    pontuados em paralelo por vários processos. Os arrays são enviados uma única
+    vez a cada processo e os blocos são juntos pela ordem original.
+    """
+    n_processos = os.cpu_count() or 1
+    limites = np.linspace(0, len(argumentos[0]), n_processos * 4 + 1, dtype=np.int64)
+    blocos = list(zip(limites[:-1], limites[1:]))
+
+    with ProcessPoolExecutor(
+        max_workers=n_processos,
+        initializer=_iniciar_processo,
+        initargs=(argumentos,),
+    ) as executor:
+        return np.concatenate(list(executor.map(_pontuar_bloco, blocos)))
+
+
+def pares_mesmo_ano(idx1, anos1, anos2, anos2_alt):
+    """
+    Junta cada moeda idx1 (com ano anos1) às moedas do Numista com o mesmo ano ou
+    ano gregoriano, através de uma pesquisa binária sobre os anos do Numista ordenados.
+    Os pares saem agrupados por idx1 e, dentro de cada um, pela ordem do df2.
+    """
+    # Cada moeda do Numista entra com o seu ano e, se for diferente, com o alternativo
+    posicoes = np.arange(len(anos2))
+    alternativos = (anos2_alt != SEM_ANO) & (anos2_alt != anos2)
+    chaves = np.concatenate([anos2, anos2_alt[alternativos]])
+    posicoes = np.concatenate([posicoes, posicoes[alternativos]])
+    com_ano = chaves != SEM_ANO
+    chaves = chaves[com_ano]
+    posicoes = posicoes[com_ano]
+
+    # Ordenar por ano e, dentro do mesmo ano, pela ordem do df2 (desempate)
+    ordem = np.lexsort((posicoes, chaves))
+    chaves = chaves[ordem]
+    posicoes = posicoes[ordem]
+
+    # Intervalo [inicio, fim) de moedas do Numista com o ano de cada moeda do uCoin
+    inicio = np.searchsorted(chaves, anos1, side="left")
+    fim = np.searchsorted(chaves, anos1, side="right")
+    contagens = fim - inicio
+
+    i_idx = np.repeat(idx1, contagens)
+    deslocamentos = np.arange(contagens.sum()) - np.repeat(
+        np.cumsum(contagens) - contagens, contagens
+    )
+    j_idx = posicoes[np.repeat(inicio, contagens) + deslocamentos]
+    return i_idx.astype(np.int64), j_idx.astype(np.int64)
 
 
 def tentar_match_aproximado(df1, df2):
@@ -141,186 +560,67 @@ def tentar_match_aproximado(df1, df2):
     3. Diâmetro deve ser igual (com tolerância de ±0.5mm)
     4. Valor da moeda comparado por números apenas
     """
+    # Pré-calcular as características de cada moeda uma única vez
+    c1 = caracteristicas_ucoin(df1)
+    c2 = caracteristicas_numista(df2)
+
+    # Pares candidatos (i, j): como o ano é obrigatório, só as moedas do Numista
+    # com o mesmo ano (ou ano gregoriano) são candidatas a match
+    validas1 = np.flatnonzero((c1["pais"] != "") & (c1["ano"] != SEM_ANO))
+    i_idx, j_idx = pares_mesmo_ano(
+        validas1, c1["ano"][validas1], c2["ano"], c2["ano_alt"]
+    )
+
+    # O critério do país só depende dos nomes normalizados: avaliá-lo uma única
+    # vez por cada par distinto de nomes (há poucas centenas de países, mas
+    # muitos pares de moedas)
+    (codigos_pais1, codigos_emissor2, codigos_pais2), nomes = fatorizar(
+        c1["pais"], c2["emissor"], c2["pais"]
+    )
+    compatibilidade = matriz_contencao(nomes, nomes)
+
+    argumentos = (
+        i_idx,
+        j_idx,
+        codigos_pais1,
+        codigos_emissor2,
+        codigos_pais2,
+        compatibilidade,
+        np.array(c1["diametro"], dtype=np.float64),
+        np.array(c2["diametro"], dtype=np.float64),
+        relacao_textos(c1["valor"], c2["valor"], i_idx, j_idx),
+        relacao_textos(c1["ref"], c2["ref"], i_idx, j_idx),
+    )
+    if njit is None and len(i_idx) > LIMIAR_PARALELO and (os.cpu_count() or 1) > 1:
+        scores = pontuar_pares_em_paralelo(argumentos)
+    else:
+        scores = pontuar_pares(*argumentos)
+    melhor_j, melhor_score = escolher_matches(i_idx, j_idx, scores, len(df1), len(df2))
+
     matches = []
-    matched_idx2 = set()
+    for i in np.flatnonzero(melhor_j >= 0):
+        matches.append(
+            {
+                "idx_ucoin": df1.index[i],
+                "idx_numista": df2.index[melhor_j[i]],
+                "score": int(melhor_score[i]),
+            }
+        )
 
-    for idx1, row1 in df1.iterrows():
-        melhor_score = 0
-        melhor_idx2 = None
+    return matches
 
-        # Critérios obrigatórios do uCoin
-        pais1 = normalizar_para_comparacao(row1.get("país", ""))
-        ano1_raw = row1.get("ano", "")
 
-        # Para moedas de Espanha, o ano real pode estar na coluna var. (ano dentro da estrela)
-        # O ano correto é "19" + var. (ex: var. = 77 → ano = 1977)
-        var1 = row1.get("var.", "")
-        if pd.notna(var1) and pais1 and "espanha" in pais1:
-            try:
-                var_num = int(float(str(var1).strip()))
-                ano1 = 1900 + var_num
-            except:
-                # Se var. não for válido, usar o ano normal
-                try:
-                    ano1 = (
-                        int(float(str(ano1_raw).strip()))
-                        if pd.notna(ano1_raw)
-                        else None
-                    )
-                except:
-                    ano1 = None
-        else:
-            # Para outras moedas, usar o ano normal
-            try:
-                ano1 = int(float(str(ano1_raw).strip())) if pd.notna(ano1_raw) else None
-            except:
-                ano1 = None
-
-        diametro1 = extrair_diametro(row1.get("diametro, mm", ""))
-        valor1_num = extrair_numeros(row1.get("denominação", ""))
-
-        # Pular se faltar informação essencial
-        if not pais1 or not ano1:
-            continue
-
-        for idx2, row2 in df2.iterrows():
-            if idx2 in matched_idx2:  # Evitar duplicados
-                continue
-
-            # Critérios obrigatórios do Numista (usar 'diâmetro' em vez de 'diametro, mm')
-            emissor2 = normalizar_para_comparacao(row2.get("emissor", ""))
-            pais2 = normalizar_para_comparacao(row2.get("país", ""))
-
-            # Tentar ambos os anos: "ano" e "ano gregoriano"
-            ano_normal = row2.get("ano", "")
-            ano_gregoriano = row2.get("ano gregoriano", "")
-
-            ano2 = None
-            ano2_alt = None  # Ano alternativo para verificação
-
-            # Extrair "ano"
-            if (
-                pd.notna(ano_normal)
-                and str(ano_normal).strip()
-                and str(ano_normal).strip() != "nan"
-            ):
-                try:
-                    ano2 = int(float(str(ano_normal).strip()))
-                except:
-                    pass
-
-            # Extrair "ano gregoriano"
-            if (
-                pd.notna(ano_gregoriano)
-                and str(ano_gregoriano).strip()
-                and str(ano_gregoriano).strip() != "nan"
-            ):
-                try:
-                    ano2_alt = int(float(str(ano_gregoriano).strip()))
-                except:
-                    pass
-
-            # Se não temos ano2, usar o alternativo
-            if ano2 is None:
-                ano2 = ano2_alt
-                ano2_alt = None
-
-            diametro2 = extrair_diametro(row2.get("diâmetro", ""))
-            valor2_num = extrair_numeros(row2.get("valor de face", ""))
-
-            # Normalizar valores para comparação (converter decimais para inteiros se possível)
-            # Ex: "0.05" -> "5" (5 centavos), "0.5" -> "50" (50 centavos), "1.0" -> "1"
-            if valor2_num:
-                try:
-                    val_float = float(valor2_num)
-                    if val_float < 1.0:
-                        # É centavos/céntimos - multiplicar por 100
-                        valor2_num = str(int(val_float * 100))
-                    else:
-                        # É unidade inteira
-                        valor2_num = str(int(val_float))
-                except:
-                    pass
-
-            # CRITÉRIOS OBRIGATÓRIOS
-
-            # 1. País deve ser igual (com flexibilidade para variações de nome)
-            pais_match = False
-            if pais1 and (emissor2 or pais2):
-                # Match exato
-                if pais1 == emissor2 or pais1 == pais2:
-                    pais_match = True
-                # Match se um contém o outro (qualquer direção)
-                elif emissor2 and (pais1 in emissor2 or emissor2 in pais1):
-                    pais_match = True
-                elif pais2 and (pais1 in pais2 or pais2 in pais1):
-                    pais_match = True
-
-            if not pais_match:
-                continue  # OBRIGATÓRIO
-
-            # 2. Ano deve ser igual (considerar tanto "ano" quanto "ano gregoriano")
-            ano_match = False
-            if ano1 == ano2:
-                ano_match = True
-            elif ano2_alt is not None and ano1 == ano2_alt:
-                ano_match = True
-
-            if not ano_match:
-                continue  # OBRIGATÓRIO
-
-            # 3. Calcular diferença de diâmetro (se ambos disponíveis)
-            dif_diametro = None
-            if diametro1 is not None and diametro2 is not None:
-                dif_diametro = abs(diametro1 - diametro2)
-
-            # Se chegou aqui, passou nos critérios obrigatórios (país + ano)
-            score = 100  # Base score para critérios obrigatórios
-
-            # Bonus/penalidade por diâmetro
-            if dif_diametro is not None:
-                if dif_diametro <= 0.5:
-                    score += 100  # Diâmetro quase igual - PESO MUITO ALTO
-                elif dif_diametro <= 1.0:
-                    score += 70  # Diâmetro próximo
-                elif dif_diametro <= 2.0:
-                    score += 40  # Diâmetro aceitável
-                elif dif_diametro <= 3.5:
-                    score += 10  # Diâmetro razoável
-                else:
-                    # Diâmetro muito diferente - grande penalidade
-                    score -= 100  # Penalidade forte
-
-            # 4. Comparar valor (apenas números) - PESO ALTO
-            if valor1_num and valor2_num:
-                if valor1_num == valor2_num:
-                    score += 150  # Match perfeito do valor
-                elif valor1_num in valor2_num or valor2_num in valor1_num:
-                    score += 50  # Match parcial
-            elif not valor1_num and not valor2_num:
-                # Ambos sem valor numérico (raro mas possível)
-                score += 80
-
-            # 5. Comparar referência de catálogo (se disponível)
-            ref1 = normalizar_referencia(row1.get("número", ""))
-            ref2 = normalizar_referencia(row2.get("referência", ""))
-            if ref1 and ref2:
-                if ref1 == ref2:
-                    score += 200  # Match perfeito de referência - PESO MUITO ALTO
-                elif ref1 in ref2 or ref2 in ref1:
-                    score += 80  # Match parcial de referência
-
-            if score > melhor_score:
-                melhor_score = score
-                melhor_idx2 = idx2
-
-        if melhor_idx2 is not None:
-            matches.append(
-                {"idx_ucoin": idx1, "idx_numista": melhor_idx2, "score": melhor_score}
-            )
-            matched_idx2.add(melhor_idx2)
+def somar_quantidades(df, cols_chave):
+    """Agrupa pelas colunas chave, somando as quantidades e mantendo o primeiro valor das restantes"""
+    # Uma única passagem de groupby para todas as colunas
+    agregacoes = {"quantidade": "sum"}
+    for col in df.columns:
+        if col not in cols_chave and col != "quantidade":
+            agregacoes[col] = "first"
 
-    return matches
+    return df.groupby(cols_chave, dropna=False, as_index=False, observed=True).agg(
+        agregacoes
+    )
 
 
 def agrupar_moedas_duplicadas(df, tipo):
@@ -330,35 +630,17 @@ def agrupar_moedas_duplicadas(df, tipo):
         # Para moedas de Espanha, var. representa o ano dentro da estrela
         df = df.copy()
         if "var." in df.columns:
-            for idx, row in df.iterrows():
-                pais = normalizar_para_comparacao(row.get("país", ""))
-                var_val = row.get("var.", "")
-                if pd.notna(var_val) and pais and "espanha" in pais:
-                    try:
-                        var_num = int(float(str(var_val).strip()))
-                        # Ano real é 1900 + var. (ex: var. 77 → 1977)
-                        df.at[idx, "ano"] = 1900 + var_num
-                    except:
-                        pass
+            paises = pd.Series(coluna_normalizada(df, "país"), index=df.index)
+            var_num = como_inteiros(df["var."])
+            mascara = paises.str.contains("espanha") & var_num.notna()
+            # Ano real é 1900 + var. (ex: var. 77 → 1977)
+            df.loc[mascara, "ano"] = 1900 + var_num[mascara].astype(int)
 
         # Identificar colunas principais para agrupamento
         cols_chave = ["país", "ano", "denominação", "diâmetro", "número"]
         cols_chave = [c for c in cols_chave if c in df.columns]
 
-        # Agrupar e somar quantidades
-        df_agrupado = df.groupby(cols_chave, dropna=False, as_index=False).agg(
-            {"quantidade": "sum"}
-        )
-
-        # Adicionar outras colunas que possam existir (pegar primeiro valor)
-        for col in df.columns:
-            if col not in cols_chave and col != "quantidade":
-                df_temp = df.groupby(cols_chave, dropna=False, as_index=False)[
-                    col
-                ].first()
-                df_agrupado = df_agrupado.merge(df_temp, on=cols_chave, how="left")
-
-        return df_agrupado
+        return somar_quantidades(df, cols_chave)
     else:  # numista
         # Identificar colunas principais para agrupamento
         cols_chave = [
@@ -371,20 +653,7 @@ def agrupar_moedas_duplicadas(df, tipo):
         ]
         cols_chave = [c for c in cols_chave if c in df.columns]
 
-        # Agrupar e somar quantidades
-        df_agrupado = df.groupby(cols_chave, dropna=False, as_index=False).agg(
-            {"quantidade": "sum"}
-        )
-
-        # Adicionar outras colunas que possam existir (pegar primeiro valor)
-        for col in df.columns:
-            if col not in cols_chave and col != "quantidade":
-                df_temp = df.groupby(cols_chave, dropna=False, as_index=False)[
-                    col
-                ].first()
-                df_agrupado = df_agrupado.merge(df_temp, on=cols_chave, how="left")
-
-        return df_agrupado
+        return somar_quantidades(df, cols_chave)
 
 
 def comparar_moedas(df1, df2, nome1, nome2):
@@ -396,6 +665,8 @@ def comparar_moedas(df1, df2, nome1, nome2):
     # Normalizar nomes de colunas
     df1.columns = df1.columns.str.strip().str.lower()
     df2.columns = df2.columns.str.strip().str.lower()
+    df1 = reduzir_tipos(df1)
+    df2 = reduzir_tipos(df2)
 
     # Mostrar informação básica ANTES de agrupar
     print(f"📊 {nome1} (original):")
@@ -449,14 +720,22 @@ def comparar_moedas(df1, df2, nome1, nome2):
     print("🔄 A fazer matching entre os ficheiros (isto pode demorar)...")
     matches = tentar_match_aproximado(df1, df2)
 
-    matched_idx1 = {m["idx_ucoin"] for m in matches}
-    matched_idx2 = {m["idx_numista"] for m in matches}
+    matched_idx1 = np.fromiter(
+        (m["idx_ucoin"] for m in matches), dtype=np.int64, count=len(matches)
+    )
+    matched_idx2 = np.fromiter(
+        (m["idx_numista"] for m in matches), dtype=np.int64, count=len(matches)
+    )
 
     print(f"✅ Encontradas {len(matches)} correspondências entre os ficheiros\n")
 
     # Moedas não correspondidas
-    nao_match_ucoin = df1[~df1.index.isin(matched_idx1)]
-    nao_match_numista = df2[~df2.index.isin(matched_idx2)]
+    por_corresponder1 = np.ones(len(df1), dtype=bool)
+    por_corresponder1[df1.index.get_indexer(matched_idx1)] = False
+    por_corresponder2 = np.ones(len(df2), dtype=bool)
+    por_corresponder2[df2.index.get_indexer(matched_idx2)] = False
+    nao_match_ucoin = df1.iloc[por_corresponder1]
+    nao_match_numista = df2.iloc[por_corresponder2]
 
     print(f"\n{'='*80}")
     print("MOEDAS NÃO CORRESPONDIDAS")
@@ -470,60 +749,60 @@ def comparar_moedas(df1, df2, nome1, nome2):
     print("COMPARAÇÃO DE QUANTIDADES (MOEDAS CORRESPONDIDAS)")
     print(f"{'='*80}\n")
 
-    diferencas = []
-    qtd_iguais = 0
-
-    for match in matches:
-        idx1 = match["idx_ucoin"]
-        idx2 = match["idx_numista"]
-
-        row1 = df1.loc[idx1]
-        row2 = df2.loc[idx2]
-
-        qtd1 = row1.get("quantidade", 0)
-        qtd2 = row2.get("quantidade", 0)
-
-        if qtd1 != qtd2:
-            # Extract Numista number and construct link
-            numista_num = row2.get("número n# (com link)", "")
-            link_numista = ""
-            if pd.notna(numista_num) and str(numista_num).strip():
-                import re
-
-                # Extract only digits from the string
-                num_str = re.sub(r"\D", "", str(numista_num))
-                if num_str:
-                    link_numista = f"https://pt.numista.com/{num_str}"
-
-            diferencas.append(
-                {
-                    "país/emissor": row1.get("país", ""),
-                    "ano": row1.get("ano", ""),
-                    "denominação": row1.get("denominação", ""),
-                    "ref_ucoin": row1.get("número", ""),
-                    "ref_numista": row2.get("referência", ""),
-                    "qtd_ucoin": int(qtd1) if pd.notna(qtd1) else 0,
-                    "qtd_numista": int(qtd2) if pd.notna(qtd2) else 0,
-                    "diferença": (
-                        int(qtd1 - qtd2) if pd.notna(qtd1) and pd.notna(qtd2) else 0
-                    ),
-                    "link_numista": link_numista,
-                }
-            )
-        else:
-            qtd_iguais += 1
+    # Juntar as colunas de ambos os ficheiros a cada correspondência de uma só vez
+    colunas_ucoin = {
+        "país": "país/emissor",
+        "ano": "ano",
+        "denominação": "denominação",
+        "número": "ref_ucoin",
+        "quantidade": "qtd_ucoin",
+    }
+    colunas_numista = {
+        "referência": "ref_numista",
+        "quantidade": "qtd_numista",
+        "número n# (com link)": "numero_numista",
+    }
+    df_matches = pd.DataFrame(matches, columns=["idx_ucoin", "idx_numista", "score"])
+    correspondidas = (
+        df_matches.set_index("idx_ucoin")
+        .join(df1.reindex(columns=list(colunas_ucoin)).rename(columns=colunas_ucoin))
+        .merge(
+            df2.reindex(columns=list(colunas_numista)).rename(columns=colunas_numista),
+            left_on="idx_numista",
+            right_index=True,
+            how="left",
+        )
+    )
+
+    qtd1 = correspondidas["qtd_ucoin"]
+    qtd2 = correspondidas["qtd_numista"]
+    com_diferenca = (qtd1 != qtd2).to_numpy(dtype=bool, na_value=True)
+    qtd_iguais = int((~com_diferenca).sum())
+    correspondidas["diferença"] = (qtd1 - qtd2).fillna(0).astype(int)
+    correspondidas["qtd_ucoin"] = qtd1.fillna(0).astype(int)
+    correspondidas["qtd_numista"] = qtd2.fillna(0).astype(int)
+
+    df_dif = correspondidas[com_diferenca].reset_index(drop=True)
+    df_dif["link_numista"] = links_numista(df_dif["numero_numista"])
+    df_dif = df_dif[
+        [
+            "país/emissor",
+            "ano",
+            "denominação",
+            "ref_ucoin",
+            "ref_numista",
+            "qtd_ucoin",
+            "qtd_numista",
+            "diferença",
+            "link_numista",
+        ]
+    ]
 
-    if diferencas:
-        print(f"⚠️  Diferenças de quantidade: {len(diferencas)}")
+    if len(df_dif) > 0:
+        print(f"⚠️  Diferenças de quantidade: {len(df_dif)}")
         print(f"✅ Quantidades iguais: {qtd_iguais}\n")
 
-        df_dif = pd.DataFrame(diferencas)
         print(df_dif.to_string(index=False))
-
-        # Exportar para Excel
-        nome_ficheiro = f"diferencas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        write_excel_with_hyperlinks(df_dif, nome_ficheiro, "link_numista")
-        print(f"\n💾 Diferenças guardadas em: {nome_ficheiro}")
     else:
         print(
             f"✅ Todas as {len(matches)} moedas correspondidas têm quantidades iguais!"
@@ -535,16 +814,15 @@ def comparar_moedas(df1, df2, nome1, nome2):
     print(f"{'='*80}\n")
 
     # Calcular contribuições para a diferença total
-    qtd_nao_match_ucoin = (
-        nao_match_ucoin["quantidade"].sum() if len(nao_match_ucoin) > 0 else 0
-    )
-    qtd_nao_match_numista = (
-        nao_match_numista["quantidade"].sum() if len(nao_match_numista) > 0 else 0
-    )
+    qtd_nao_match_ucoin = nao_match_ucoin["quantidade"].sum()
+    qtd_nao_match_numista = nao_match_numista["quantidade"].sum()
 
     # Diferenças nas moedas correspondidas
-    dif_positivas = sum(d["diferença"] for d in diferencas if d["diferença"] > 0)
-    dif_negativas = sum(d["diferença"] for d in diferencas if d["diferença"] < 0)
+    diferenca = df_dif["diferença"].to_numpy()
+    mais_em_ucoin = diferenca > 0
+    mais_em_numista = diferenca < 0
+    dif_positivas = diferenca[mais_em_ucoin].sum()
+    dif_negativas = diferenca[mais_em_numista].sum()
 
     print("📊 Contribuições para a diferença total:\n")
     print(f"   Moedas não correspondidas:")
@@ -575,10 +853,8 @@ def comparar_moedas(df1, df2, nome1, nome2):
         print(
             "🔍 A diferença de 2 moedas vem das quantidades diferentes nas moedas correspondidas:\n"
         )
-        moedas_relevantes = sorted(
-            diferencas, key=lambda x: abs(x["diferença"]), reverse=True
-        )[:10]
-        df_rel = pd.DataFrame(moedas_relevantes)
+        ordem = df_dif["diferença"].abs().sort_values(ascending=False, kind="stable")
+        df_rel = df_dif.reindex(ordem.index).head(10)
         print(
             df_rel[
                 [
@@ -595,80 +871,45 @@ def comparar_moedas(df1, df2, nome1, nome2):
         )
 
     # Listar todas as diferenças positivas (moedas que faltam em numista)
-    moedas_faltam_numista = [d for d in diferencas if d["diferença"] > 0]
-    moedas_sobram_numista = [d for d in diferencas if d["diferença"] < 0]
+    moedas_faltam_numista = df_dif[mais_em_ucoin]
+    n_moedas_sobram_numista = int(mais_em_numista.sum())
 
     print(f"\n\n📋 RESUMO COMPLETO:\n")
     print(
         f"   • {len(moedas_faltam_numista)} tipos de moedas com mais quantidade em uCoin (+{int(dif_positivas)} unidades)"
     )
     print(
-        f"   • {len(moedas_sobram_numista)} tipos de moedas com mais quantidade em Numista ({int(dif_negativas)} unidades)"
+        f"   • {n_moedas_sobram_numista} tipos de moedas com mais quantidade em Numista ({int(dif_negativas)} unidades)"
     )
     print(f"   • Saldo líquido: {int(dif_positivas + dif_negativas)} moedas")
 
-    if moedas_faltam_numista:
-        # Salvar apenas as que faltam
-        nome_ficheiro_faltam = (
-            f"faltam_em_numista_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        )
-        df_faltam = pd.DataFrame(moedas_faltam_numista)
-        write_excel_with_hyperlinks(df_faltam, nome_ficheiro_faltam, "link_numista")
-        print(f"\n💾 Moedas com mais quantidade em uCoin: {nome_ficheiro_faltam}")
-
-    # Exportar moedas não correspondidas
-    if len(nao_match_ucoin) > 0 or len(nao_match_numista) > 0:
-        nome_ficheiro2 = (
-            f"nao_correspondidas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        )
-
-        # Add link column to unmatched numista
-        if len(nao_match_numista) > 0:
-            import re
-
-            nao_match_numista_copy = nao_match_numista.copy()
-            nao_match_numista_copy["link_numista"] = nao_match_numista_copy.apply(
-                lambda row: (
-                    f"https://pt.numista.com/{re.sub(r'\D', '', str(row.get('número n# (com link)', '')))}"
-                    if pd.notna(row.get("número n# (com link)", ""))
-                    and re.sub(r"\D", "", str(row.get("número n# (com link)", "")))
-                    else ""
-                ),
-                axis=1,
+    # Exportar todos os resultados para um único ficheiro Excel
+    folhas = {}
+    if len(df_dif) > 0:
+        folhas["Diferencas"] = df_dif
+    if len(moedas_faltam_numista) > 0:
+        folhas["Faltam_Numista"] = moedas_faltam_numista
+    if len(nao_match_ucoin) > 0:
+        folhas["Apenas_uCoin"] = nao_match_ucoin[
+            ["país", "ano", "denominação", "número", "quantidade"]
+        ]
+    if len(nao_match_numista) > 0:
+        folhas["Apenas_Numista"] = nao_match_numista[
+            ["emissor", "ano", "título", "referência", "quantidade"]
+        ].assign(
+            link_numista=links_numista(
+                obter_coluna(nao_match_numista, "número n# (com link)")
             )
+        )
 
-        with pd.ExcelWriter(nome_ficheiro2, engine="openpyxl") as writer:
-            if len(nao_match_ucoin) > 0:
-                nao_match_ucoin[
-                    ["país", "ano", "denominação", "número", "quantidade"]
-                ].to_excel(writer, sheet_name="Apenas_uCoin", index=False)
-            if len(nao_match_numista) > 0:
-                nao_match_numista_copy[
-                    [
-                        "emissor",
-                        "ano",
-                        "título",
-                        "referência",
-                        "quantidade",
-                        "link_numista",
-                    ]
-                ].to_excel(writer, sheet_name="Apenas_Numista", index=False)
-
-        # Add hyperlinks to Apenas_Numista sheet
-        if len(nao_match_numista) > 0:
-            wb = load_workbook(nome_ficheiro2)
-            if "Apenas_Numista" in wb.sheetnames:
-                ws = wb["Apenas_Numista"]
-                # Find link_numista column (should be column F - the 6th column)
-                for row in range(2, ws.max_row + 1):
-                    cell = ws.cell(row=row, column=6)  # Column F
-                    if cell.value and str(cell.value).startswith("http"):
-                        url = str(cell.value)
-                        cell.hyperlink = url
-                        cell.style = "Hyperlink"
-                wb.save(nome_ficheiro2)
-
-        print(f"💾 Moedas não correspondidas guardadas em: {nome_ficheiro2}")
+    if folhas:
+        nome_ficheiro = f"comparacao_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        # O xlsxwriter converte os URLs em hyperlinks ao escrever as células
+        with pd.ExcelWriter(nome_ficheiro, engine="xlsxwriter") as writer:
+            for nome_folha, df_folha in folhas.items():
+                df_folha.to_excel(writer, sheet_name=nome_folha, index=False)
+        print(f"\n💾 Resultados guardados em: {nome_ficheiro}")
+        print(f"   Folhas: {', '.join(folhas)}")
 
 
 def main():
@@ -3,87 +3,125 @@
 Script to compare coins and quantities between Excel files (ucoin.xlsx and numista.xlsx)
 """
 
+import re
 import sys
 from datetime import datetime
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
 
+try:
+    from numba import njit, prange
+except ImportError:
+    # Numba is optional: without it the matching runs the same functions in Python
+    njit = None
+    prange = range
+
+
+# Columns used from each export (names after strip + lowercase)
+UCOIN_COLUMNS = {
+    "country",
+    "year",
+    "var.",
+    "denomination",
+    "diameter, mm",
+    "number",
+    "quantity",
+}
+NUMISTA_COLUMNS = {
+    "issuer",
+    "country",
+    "year",
+    "gregorian year",
+    "title",
+    "face value",
+    "diameter",
+    "reference",
+    "quantity",
+    "n# number (with link)",
+}
+
+
+def load_excel(file, columns=None):
+    """Load Excel file and return a DataFrame (only the given columns, if any)"""
+
+    def is_used_column(col):
+        return str(col).strip().lower() in columns
+
+    usecols = None if columns is None else is_used_column
 
-def write_excel_with_hyperlinks(df, filename, link_column="link_numista"):
-    """Write DataFrame to Excel with clickable hyperlinks"""
-    # First write the dataframe normally
-    df.to_excel(filename, index=False)
+    try:
+        try:
+            # python-calamine is much faster than openpyxl
+            return pd.read_excel(file, engine="calamine", usecols=usecols)
+        except (ImportError, ValueError):
+            # Not installed, or a pandas version without the calamine engine
+            if file.endswith(".xlsx"):
+                return pd.read_excel(file, engine="openpyxl", usecols=usecols)
+            return pd.read_excel(file, usecols=usecols)
+    except Exception as e:
+        print(f"Error loading {file}: {e}")
+        sys.exit(1)
 
-    # Then load the workbook and convert links to hyperlinks
-    wb = load_workbook(filename)
-    ws = wb.active
 
-    # Find the column index for the link column
-    headers = [cell.value for cell in ws[1]]
-    if link_column in headers:
-        link_col_idx = headers.index(link_column) + 1
+# Regular expressions compiled once
+_NUMBERS_RE = re.compile(r"\d+\.?\d*")
+_DIAMETER_RE = re.compile(r"(\d+\.?\d*)")
+_KM_VARIANT_RE = re.compile(r"(KM#|Y#)\s*A(\d+)")
+_NON_DIGITS_RE = re.compile(r"\D")
 
-        # Convert URLs to hyperlinks (starting from row 2, skipping header)
-        for row in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row, column=link_col_idx)
-            if cell.value and str(cell.value).startswith("http"):
-                url = str(cell.value)
-                cell.hyperlink = url
-                cell.style = "Hyperlink"
+NUMISTA_URL = "https://pt.numista.com/"
 
-    wb.save(filename)
+# Combining marks left behind by NFKD decomposition (accents, cedilla, tilde...)
+_COMBINING_MARKS_RE = re.compile(
+    "[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+)
 
 
-def load_excel(file):
-    """Load Excel file and return a DataFrame"""
-    try:
-        if file.endswith(".xlsx"):
-            df = pd.read_excel(file, engine="openpyxl")
-        else:
-            df = pd.read_excel(file)
-        return df
-    except Exception as e:
-        print(f"Error loading {file}: {e}")
-        sys.exit(1)
+def normalize_series(s):
+    """Normalize a whole column for comparison (remove accents, lowercase, etc)"""
+    s = s.astype("string").fillna("").str.lower().str.strip()
+    # Remove accents: decompose and drop the combining marks
+    s = s.str.normalize("NFKD").str.replace(_COMBINING_MARKS_RE, "", regex=True)
 
+    # Normalize common country name variations
+    s = s.mask(s.str.contains("united states") | s.eq("usa"), "usa")
+    s = s.mask(s.str.contains("soviet union") | s.eq("ussr"), "ussr")
+    return s
 
-def normalize_for_comparison(s):
-    """Normalize string for comparison (remove accents, convert to lowercase, etc)"""
-    if pd.isna(s):
-        return ""
-    s = str(s).lower().strip()
-    # Remove special characters
-    s = s.replace("ã", "a").replace("á", "a").replace("à", "a")
-    s = s.replace("é", "e").replace("ê", "e")
-    s = s.replace("í", "i")
-    s = s.replace("ó", "o").replace("õ", "o").replace("ô", "o")
-    s = s.replace("ú", "u").replace("ü", "u")
-    s = s.replace("ç", "c")
 
-    # Normalize common country name variations
-    if "united states" in s or s == "usa":
-        return "usa"
-    if "soviet union" in s or s == "ussr":
-        return "ussr"
+def get_column(df, column):
+    """Return the DataFrame column (or an empty column if it does not exist)"""
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    return df[column]
 
-    return s
+
+def normalized_column(df, column):
+    """Return the normalized column as an array (empty strings if it is missing)"""
+    s = get_column(df, column)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Normalize each category once and expand through the integer codes
+        categories = normalize_series(pd.Series(s.cat.categories, dtype=object))
+        normalized = np.append(categories.to_numpy(dtype=object), "")
+        return normalized[s.cat.codes.to_numpy()]  # code -1 (NaN) -> ""
+    return normalize_series(s).to_numpy(dtype=object)
 
 
 def normalize_reference(ref):
     """Normalize catalog reference for comparison"""
-    if pd.isna(ref):
-        return ""
-    ref = str(ref).strip().upper()
+    return _normalize_reference("" if pd.isna(ref) else str(ref))
+
+
+@lru_cache(maxsize=8192)
+def _normalize_reference(ref):
+    ref = ref.strip().upper()
     # Remove spaces and normalize separators
     ref = ref.replace(" ", "")
     # Remove variant letters that might appear (e.g., KM# A192 -> KM#192)
     # But keep letters at the end (e.g., KM# 164a)
-    import re
-
-    # Match pattern like KM# A123 and convert to KM#123
-    ref = re.sub(r"(KM#|Y#)\s*A(\d+)", r"\1\2", ref)
+    ref = _KM_VARIANT_RE.sub(r"\1\2", ref)
     return ref
 
 
@@ -91,9 +129,14 @@ def extract_numbers(text):
     """Extract only numbers from text"""
     if pd.isna(text):
         return ""
-    import re
+    return _extract_numbers(str(text))
 
-    numbers = re.findall(r"\d+\.?\d*", str(text))
+
+@lru_cache(maxsize=8192)
+def _extract_numbers(text):
+    if text.isdecimal():
+        return text
+    numbers = _NUMBERS_RE.findall(text)
     return "".join(numbers)
 
 
@@ -101,9 +144,14 @@ def extract_diameter(diameter_str):
     """Extract numeric value from diameter"""
     if pd.isna(diameter_str):
         return None
-    import re
+    if isinstance(diameter_str, float):
+        return diameter_str
+    return _extract_diameter(str(diameter_str))
+
 
-    match = re.search(r"(\d+\.?\d*)", str(diameter_str))
+@lru_cache(maxsize=8192)
+def _extract_diameter(diameter_str):
+    match = _DIAMETER_RE.search(diameter_str)
     if match:
         try:
             return float(match.group(1))
@@ -112,6 +160,343 @@ def extract_diameter(diameter_str):
     return None
 
 
+def diameters_as_array(s):
+    """Extract the diameters of a column as a float64 array (NaN if missing)"""
+    return np.array([extract_diameter(d) for d in s], dtype=np.float64)
+
+
+def texts_as_array(normalize, s):
+    """Apply a text normalization to each value of a column, as an object array"""
+    return np.array([normalize(value) for value in s], dtype=object)
+
+
+# Missing/invalid year in the year arrays (there is no year 0)
+NO_YEAR = 0
+
+
+def as_integers(s):
+    """Convert a column to integers (Int64), with <NA> for empty or invalid values"""
+    numbers = pd.to_numeric(s.astype("string").str.strip(), errors="coerce")
+    numbers = numbers.astype("Float64").mask(np.isinf(numbers), pd.NA)
+    return np.trunc(numbers).astype("Int64")
+
+
+def years_as_array(s):
+    """Convert a year column to an int64 array (NO_YEAR if empty or invalid)"""
+    return as_integers(s).to_numpy(dtype=np.int64, na_value=NO_YEAR)
+
+
+def canonical_value(value_num):
+    """
+    Normalize a face value for comparison (convert decimals to integers if possible)
+    E.g., "0.05" -> "5" (5 cents), "0.5" -> "50" (50 cents), "1.0" -> "1"
+    """
+    if not value_num:
+        return value_num
+    try:
+        val_float = float(value_num)
+        if val_float < 1.0:
+            # It's cents - multiply by 100
+            return str(int(val_float * 100))
+        # It's a whole unit
+        return str(int(val_float))
+    except (ValueError, OverflowError):
+        return value_num
+
+
+def factorize_texts(*columns):
+    """
+    Encode the texts of several columns with pd.factorize over their union, so
+    equal texts get the same integer code in every column. Empty texts get -1.
+    Returns the list of int32 code arrays (one per column) and the unique texts.
+    """
+    union = pd.Series(np.concatenate([np.asarray(c, dtype=object) for c in columns]))
+    codes, uniques = pd.factorize(union.replace("", None))
+    bounds = np.cumsum([len(c) for c in columns])[:-1]
+    return np.split(codes.astype(np.int32), bounds), np.asarray(uniques, dtype=object)
+
+
+# add_ucoin_match_columns / add_numista_match_columns store the values the
+# matcher works on as _-prefixed columns: int64 years, float64 diameters (NaN if
+# missing) and normalized texts
+
+
+def add_ucoin_match_columns(df):
+    """Compute the uCoin matching features once per row, as _-prefixed columns"""
+    # Mandatory criteria from uCoin
+    countries = normalized_column(df, "country")
+
+    # For Spanish coins, the real year may be in the var. column (year within the star)
+    # The correct year is "19" + var. (e.g., var. = 77 → year = 1977)
+    # For other coins (or an invalid var.), use the normal year
+    var_num = as_integers(get_column(df, "var."))
+    is_spain = pd.Series(countries, index=df.index).str.contains("spain|espanha")
+    use_var = (is_spain & var_num.notna()).to_numpy(dtype=bool)
+    years = np.where(
+        use_var,
+        1900 + var_num.to_numpy(dtype=np.int64, na_value=NO_YEAR),
+        years_as_array(get_column(df, "year")),
+    )
+
+    return df.assign(
+        _country_norm=countries,
+        _year_int=years,
+        _diameter=diameters_as_array(get_column(df, "diameter, mm")),
+        _value_num=texts_as_array(extract_numbers, get_column(df, "denomination")),
+        _ref_norm=texts_as_array(normalize_reference, get_column(df, "number")),
+    )
+
+
+def add_numista_match_columns(df):
+    """Compute the Numista matching features once per row, as _-prefixed columns"""
+    # Mandatory criteria from Numista, normalized once per column
+    issuers = normalized_column(df, "issuer")
+    countries = normalized_column(df, "country")
+
+    # Try both years: "year" and "gregorian year"
+    years = years_as_array(get_column(df, "year"))
+    years_alt = years_as_array(get_column(df, "gregorian year"))
+
+    # If we don't have a year, use the alternative
+    no_year = years == NO_YEAR
+    years = np.where(no_year, years_alt, years)
+    years_alt = np.where(no_year, NO_YEAR, years_alt)
+
+    return df.assign(
+        _issuer_norm=issuers,
+        _country_norm=countries,
+        _year_int=years,
+        _year_alt_int=years_alt,
+        _diameter=diameters_as_array(get_column(df, "diameter")),
+        _value_num=texts_as_array(
+            lambda value: canonical_value(extract_numbers(value)),
+            get_column(df, "face value"),
+        ),
+        _ref_norm=texts_as_array(normalize_reference, get_column(df, "reference")),
+    )
+
+
+def numista_links(numbers):
+    """Build the Numista links from the N# numbers (with link)"""
+    # Extract only digits from the string
+    digits = numbers.astype("string").str.replace(_NON_DIGITS_RE, "", regex=True)
+    digits = digits.fillna("")
+    return (NUMISTA_URL + digits).where(digits != "", "").astype(object)
+
+
+def countries_match(country1, issuer2, country2):
+    """Country must match (with flexibility for name variations)"""
+    if not country1 or not (issuer2 or country2):
+        return False
+    # Exact match
+    if country1 == issuer2 or country1 == country2:
+        return True
+    # Match if one contains the other (any direction)
+    if issuer2 and (country1 in issuer2 or issuer2 in country1):
+        return True
+    if country2 and (country1 in country2 or country2 in country1):
+        return True
+    return False
+
+
+# Relation between two texts (catalog values or references)
+REL_NONE = 0
+REL_PARTIAL = 1  # One contains the other
+REL_EQUAL = 2
+REL_BOTH_EMPTY = 3  # Both without value
+
+
+@lru_cache(maxsize=None)
+def text_relation(text1, text2):
+    """
+    Relation (REL_*) between two normalized texts. Cached: a collection has few
+    distinct values/references, so each combination is only compared once.
+    """
+    if not text1 and not text2:
+        return REL_BOTH_EMPTY
+    if not text1 or not text2:
+        return REL_NONE
+    if text1 == text2:
+        return REL_EQUAL
+    if text1 in text2 or text2 in text1:
+        return REL_PARTIAL
+    return REL_NONE
+
+
+def text_relations(codes1, codes2, texts, i_idx, j_idx):
+    """
+    Relation (REL_*) between the texts of each candidate pair (i_idx[k], j_idx[k]),
+    given their factorize_texts codes. Equal and empty texts are integer compares;
+    text_relation only runs once per distinct combination of different texts.
+    """
+    codes1 = codes1[i_idx]
+    codes2 = codes2[j_idx]
+
+    empty1 = codes1 < 0
+    empty2 = codes2 < 0
+    relations = np.full(len(i_idx), REL_NONE, dtype=np.int8)
+    relations[empty1 & empty2] = REL_BOTH_EMPTY
+    relations[~empty1 & (codes1 == codes2)] = REL_EQUAL
+
+    # Different texts, both filled: check if one contains the other
+    # (each combination of codes is packed into a single int64 key)
+    different = np.flatnonzero(~empty1 & ~empty2 & (codes1 != codes2))
+    combinations, inverse = np.unique(
+        codes1[different].astype(np.int64) * len(texts) + codes2[different],
+        return_inverse=True,
+    )
+    partial = np.array(
+        [
+            text_relation(texts[code1], texts[code2]) == REL_PARTIAL
+            for code1, code2 in (divmod(int(key), len(texts)) for key in combinations)
+        ],
+        dtype=np.bool_,
+    )
+    relations[different[partial[inverse.ravel()]]] = REL_PARTIAL
+    return relations
+
+
+def same_year_pairs(idx1, years1, years2, years2_alt):
+    """
+    Pair each coin idx1 (with year years1) with the Numista coins of the same year
+    or gregorian year, through a binary search over the sorted Numista years.
+    Pairs come out grouped by idx1 and, within each one, in df2 order.
+    """
+    # Each Numista coin enters with its year and, if different, the alternative
+    positions = np.arange(len(years2))
+    alternatives = (years2_alt != NO_YEAR) & (years2_alt != years2)
+    keys = np.concatenate([years2, years2_alt[alternatives]])
+    positions = np.concatenate([positions, positions[alternatives]])
+    with_year = keys != NO_YEAR
+    keys = keys[with_year]
+    positions = positions[with_year]
+
+    # Sort by year and, within the same year, by df2 order (tie-breaking)
+    order = np.lexsort((positions, keys))
+    keys = keys[order]
+    positions = positions[order]
+
+    # Range [start, end) of Numista coins with the year of each uCoin coin
+    start = np.searchsorted(keys, years1, side="left")
+    end = np.searchsorted(keys, years1, side="right")
+    counts = end - start
+
+    i_idx = np.repeat(idx1, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    j_idx = positions[np.repeat(start, counts) + offsets]
+    return i_idx.astype(np.int64), j_idx.astype(np.int64)
+
+
+# Diameter difference bonus: DIAMETER_BONUS[k] applies up to (and including)
+# DIAMETER_LIMITS[k] mm, the last one above 3.5mm. np.searchsorted (side="left")
+# returns the first limit >= the difference, so one lookup replaces the if ladder
+DIAMETER_LIMITS = np.array([0.5, 1.0, 2.0, 3.5])
+DIAMETER_BONUS = np.array(
+    [
+        100,  # Almost identical diameter - VERY HIGH WEIGHT
+        70,  # Close diameter
+        40,  # Acceptable diameter
+        10,  # Reasonable diameter
+        -100,  # Very different diameter - strong penalty
+    ],
+    dtype=np.int64,
+)
+
+
+def diameter_bonuses(diameters1, diameters2, i_idx, j_idx):
+    """
+    Diameter bonus/penalty of each candidate pair, looked up for all pairs at once
+    (0 when either diameter is missing)
+    """
+    diameter_diffs = np.abs(diameters1[i_idx] - diameters2[j_idx])
+    bonuses = DIAMETER_BONUS[np.searchsorted(DIAMETER_LIMITS, diameter_diffs)]
+    bonuses[np.isnan(diameter_diffs)] = 0
+    return bonuses
+
+
+def score_pairs(
+    i_idx,
+    j_idx,
+    country_codes1,
+    country_ids2,
+    compatible,
+    diameter_bonus,
+    value_relations,
+    ref_relations,
+):
+    """
+    Score each candidate pair (i_idx[k], j_idx[k]).
+    Only uses numeric arrays, so it can be compiled with Numba.
+    Pairs failing a mandatory criterion get score 0.
+    """
+    scores = np.zeros(len(i_idx), dtype=np.int64)
+    for k in prange(len(i_idx)):
+        i = i_idx[k]
+        j = j_idx[k]
+
+        # MANDATORY CRITERIA
+
+        # 1. Country must match (precomputed per combination of names)
+        if not compatible[country_codes1[i], country_ids2[j]]:
+            continue  # MANDATORY
+
+        # 2. Year must match: guaranteed by same_year_pairs
+
+        # If we got here, mandatory criteria passed (country + year)
+        score = 100  # Base score for mandatory criteria
+
+        # 3. Bonus/penalty for diameter (if both available, see diameter_bonuses)
+        score += diameter_bonus[k]
+
+        # 4. Compare value (numbers only) - HIGH WEIGHT
+        if value_relations[k] == REL_EQUAL:
+            score += 150  # Perfect value match
+        elif value_relations[k] == REL_PARTIAL:
+            score += 50  # Partial match
+        elif value_relations[k] == REL_BOTH_EMPTY:
+            # Both without numeric value (rare but possible)
+            score += 80
+
+        # 5. Compare catalog reference (if available)
+        if ref_relations[k] == REL_EQUAL:
+            score += 200  # Perfect reference match - VERY HIGH WEIGHT
+        elif ref_relations[k] == REL_PARTIAL:
+            score += 80  # Partial reference match
+
+        scores[k] = score
+    return scores
+
+
+def choose_matches(i_idx, j_idx, scores, n1, n2):
+    """
+    For each uCoin coin (in df1 order), choose the unused candidate with the
+    highest score. Pairs must be grouped by i and, within each i, in df2 order
+    (on a tie the first one wins).
+    """
+    best_j = np.full(n1, -1, dtype=np.int64)
+    best_score = np.zeros(n1, dtype=np.int64)
+    matched2 = np.zeros(n2, dtype=np.bool_)  # Avoid duplicates
+
+    k = 0
+    while k < len(i_idx):
+        i = i_idx[k]
+        while k < len(i_idx) and i_idx[k] == i:
+            j = j_idx[k]
+            if not matched2[j] and scores[k] > best_score[i]:
+                best_score[i] = scores[k]
+                best_j[i] = j
+            k += 1
+        if best_j[i] >= 0:
+            matched2[best_j[i]] = True
+
+    return best_j, best_score
+
+
+if njit is not None:
+    score_pairs = njit(parallel=True, cache=True)(score_pairs)
+    choose_matches = njit(cache=True)(choose_matches)
+
+
 def approximate_match(df1, df2):
     """
     Matching using mandatory criteria:
@@ -120,194 +505,111 @@ def approximate_match(df1, df2):
     3. Diameter used as scoring factor
     4. Coin value compared by numbers only
     """
+    # Reuse the normalized columns if the caller already added them
+    if "_country_norm" not in df1.columns:
+        df1 = add_ucoin_match_columns(df1)
+    if "_issuer_norm" not in df2.columns:
+        df2 = add_numista_match_columns(df2)
+    countries1 = np.asarray(df1["_country_norm"], dtype=object)
+    years1 = df1["_year_int"].to_numpy(dtype=np.int64)
+
+    # Candidate pairs (i, j): year is mandatory, so only Numista coins with the
+    # same year (or gregorian year) are candidates. Skip uCoin coins missing
+    # essential information
+    valid1 = np.flatnonzero((countries1 != "") & (years1 != NO_YEAR))
+    i_idx, j_idx = same_year_pairs(
+        valid1,
+        years1[valid1],
+        df2["_year_int"].to_numpy(dtype=np.int64),
+        df2["_year_alt_int"].to_numpy(dtype=np.int64),
+    )
+
+    # The country criterion only depends on the normalized names: give each
+    # distinct Numista (issuer, country) combination an id and evaluate it once
+    # per distinct uCoin country (a few hundred countries, but many coin pairs)
+    combinations2 = {}
+    country_ids2 = np.array(
+        [
+            combinations2.setdefault(names, len(combinations2))
+            for names in zip(df2["_issuer_norm"], df2["_country_norm"])
+        ],
+        dtype=np.int64,
+    )
+    country_codes1, country_names1 = pd.factorize(countries1)
+    compatible = np.array(
+        [
+            [
+                countries_match(country1, issuer2, country2)
+                for issuer2, country2 in combinations2
+            ]
+            for country1 in country_names1
+        ],
+        dtype=np.bool_,
+    ).reshape(len(country_names1), len(combinations2))
+
+    # Values and references as integer codes (equal texts share a code)
+    (value_codes1, value_codes2), value_texts = factorize_texts(
+        df1["_value_num"], df2["_value_num"]
+    )
+    (ref_codes1, ref_codes2), ref_texts = factorize_texts(
+        df1["_ref_norm"], df2["_ref_norm"]
+    )
+
+    scores = score_pairs(
+        i_idx,
+        j_idx,
+        country_codes1.astype(np.int64),
+        country_ids2,
+        compatible,
+        diameter_bonuses(
+            df1["_diameter"].to_numpy(dtype=np.float64),
+            df2["_diameter"].to_numpy(dtype=np.float64),
+            i_idx,
+            j_idx,
+        ),
+        text_relations(value_codes1, value_codes2, value_texts, i_idx, j_idx),
+        text_relations(ref_codes1, ref_codes2, ref_texts, i_idx, j_idx),
+    )
+    best_j, best_score = choose_matches(i_idx, j_idx, scores, len(df1), len(df2))
+
     matches = []
-    matched_idx2 = set()
-
-    for idx1, row1 in df1.iterrows():
-        best_score = 0
-        best_idx2 = None
-
-        # Mandatory criteria from uCoin
-        country1 = normalize_for_comparison(row1.get("country", ""))
-        year1_raw = row1.get("year", "")
-
-        # For Spanish coins, the real year may be in the var. column (year within the star)
-        # The correct year is "19" + var. (e.g., var. = 77 → year = 1977)
-        var1 = row1.get("var.", "")
-        if (
-            pd.notna(var1)
-            and country1
-            and ("spain" in country1 or "espanha" in country1)
-        ):
-            try:
-                var_num = int(float(str(var1).strip()))
-                year1 = 1900 + var_num
-            except:
-                # If var. is not valid, use normal year
-                try:
-                    year1 = (
-                        int(float(str(year1_raw).strip()))
-                        if pd.notna(year1_raw)
-                        else None
-                    )
-                except:
-                    year1 = None
-        else:
-            # For other coins, use normal year
-            try:
-                year1 = (
-                    int(float(str(year1_raw).strip())) if pd.notna(year1_raw) else None
-                )
-            except:
-                year1 = None
-
-        diameter1 = extract_diameter(row1.get("diameter, mm", ""))
-        value1_num = extract_numbers(row1.get("denomination", ""))
-
-        # Skip if essential information is missing
-        if not country1 or not year1:
-            continue
-
-        for idx2, row2 in df2.iterrows():
-            if idx2 in matched_idx2:  # Avoid duplicates
-                continue
-
-            # Mandatory criteria from Numista
-            issuer2 = normalize_for_comparison(row2.get("issuer", ""))
-            country2 = normalize_for_comparison(row2.get("country", ""))
-
-            # Try both years: "year" and "gregorian year"
-            year_normal = row2.get("year", "")
-            year_gregorian = row2.get("gregorian year", "")
-
-            year2 = None
-            year2_alt = None  # Alternative year for verification
-
-            # Extract "ano"
-            if (
-                pd.notna(year_normal)
-                and str(year_normal).strip()
-                and str(year_normal).strip() != "nan"
-            ):
-                try:
-                    year2 = int(float(str(year_normal).strip()))
-                except:
-                    pass
-
-            # Extract "ano gregoriano"
-            if (
-                pd.notna(year_gregorian)
-                and str(year_gregorian).strip()
-                and str(year_gregorian).strip() != "nan"
-            ):
-                try:
-                    year2_alt = int(float(str(year_gregorian).strip()))
-                except:
-                    pass
-
-            # If we don't have year2, use the alternative
-            if year2 is None:
-                year2 = year2_alt
-                year2_alt = None
-
-            diameter2 = extract_diameter(row2.get("diameter", ""))
-            value2_num = extract_numbers(row2.get("face value", ""))
-
-            # Normalize values for comparison (convert decimals to integers if possible)
-            # E.g., "0.05" -> "5" (5 cents), "0.5" -> "50" (50 cents), "1.0" -> "1"
-            if value2_num:
-                try:
-                    val_float = float(value2_num)
-                    if val_float < 1.0:
-                        # It's cents - multiply by 100
-                        value2_num = str(int(val_float * 100))
-                    else:
-                        # It's a whole unit
-                        value2_num = str(int(val_float))
-                except:
-                    pass
-
-            # MANDATORY CRITERIA
-
-            # 1. Country must match (with flexibility for name variations)
-            country_match = False
-            if country1 and (issuer2 or country2):
-                # Exact match
-                if country1 == issuer2 or country1 == country2:
-                    country_match = True
-                # Match if one contains the other (any direction)
-                elif issuer2 and (country1 in issuer2 or issuer2 in country1):
-                    country_match = True
-                elif country2 and (country1 in country2 or country2 in country1):
-                    country_match = True
-
-            if not country_match:
-                continue  # MANDATORY
-
-            # 2. Year must match (consider both "ano" and "ano gregoriano")
-            year_match = False
-            if year1 == year2:
-                year_match = True
-            elif year2_alt is not None and year1 == year2_alt:
-                year_match = True
-
-            if not year_match:
-                continue  # MANDATORY
-
-            # 3. Calculate diameter difference (if both available)
-            diameter_diff = None
-            if diameter1 is not None and diameter2 is not None:
-                diameter_diff = abs(diameter1 - diameter2)
-
-            # If we got here, mandatory criteria passed (country + year)
-            score = 100  # Base score for mandatory criteria
-
-            # Bonus/penalty for diameter
-            if diameter_diff is not None:
-                if diameter_diff <= 0.5:
-                    score += 100  # Almost identical diameter - VERY HIGH WEIGHT
-                elif diameter_diff <= 1.0:
-                    score += 70  # Close diameter
-                elif diameter_diff <= 2.0:
-                    score += 40  # Acceptable diameter
-                elif diameter_diff <= 3.5:
-                    score += 10  # Reasonable diameter
-                else:
-                    # Very different diameter - big penalty
-                    score -= 100  # Strong penalty
-
-            # 4. Compare value (numbers only) - HIGH WEIGHT
-            if value1_num and value2_num:
-                if value1_num == value2_num:
-                    score += 150  # Perfect value match
-                elif value1_num in value2_num or value2_num in value1_num:
-                    score += 50  # Partial match
-            elif not value1_num and not value2_num:
-                # Both without numeric value (rare but possible)
-                score += 80
-
-            # 5. Compare catalog reference (if available)
-            ref1 = normalize_reference(row1.get("number", ""))
-            ref2 = normalize_reference(row2.get("reference", ""))
-            if ref1 and ref2:
-                if ref1 == ref2:
-                    score += 200  # Perfect reference match - VERY HIGH WEIGHT
-                elif ref1 in ref2 or ref2 in ref1:
-                    score += 80  # Partial reference match
-
-            if score > best_score:
-                best_score = score
-                best_idx2 = idx2
-
-        if best_idx2 is not None:
-            matches.append(
-                {"idx_ucoin": idx1, "idx_numista": best_idx2, "score": best_score}
-            )
-            matched_idx2.add(best_idx2)
+    for i in np.flatnonzero(best_j >= 0):
+        matches.append(
+            {
+                "idx_ucoin": df1.index[i],
+                "idx_numista": df2.index[best_j[i]],
+                "score": int(best_score[i]),
+            }
+        )
 
     return matches
 
 
+def to_categories(df):
+    """
+    Store the low-cardinality text columns as category: each distinct name is
+    kept once and rows hold integer codes (less memory, faster grouping)
+    """
+    df = df.copy()
+    for col in ["country", "issuer", "denomination", "number", "reference"]:
+        if col in df.columns and pd.api.types.infer_dtype(df[col]) == "string":
+            df[col] = df[col].astype("category")
+    return df
+
+
+def sum_quantities(df, key_cols):
+    """Group by the key columns, summing quantities and keeping the first value of the other columns"""
+    # A single groupby pass for every column
+    aggregations = {"quantity": "sum"}
+    for col in df.columns:
+        if col not in key_cols and col != "quantity":
+            aggregations[col] = "first"
+
+    return df.groupby(key_cols, dropna=False, as_index=False, observed=True).agg(
+        aggregations
+    )
+
+
 def group_duplicate_coins(df, type):
     """Group identical coins and sum quantities"""
     if type == "ucoin":
@@ -315,39 +617,18 @@ def group_duplicate_coins(df, type):
         # For Spanish coins, var. represents the year within the star
         df = df.copy()
         if "var." in df.columns:
-            for idx, row in df.iterrows():
-                country = normalize_for_comparison(row.get("country", ""))
-                var_val = row.get("var.", "")
-                if (
-                    pd.notna(var_val)
-                    and country
-                    and ("spain" in country or "espanha" in country)
-                ):
-                    try:
-                        var_num = int(float(str(var_val).strip()))
-                        # Real year is 1900 + var. (e.g., var. 77 → 1977)
-                        df.at[idx, "year"] = 1900 + var_num
-                    except:
-                        pass
+            countries = pd.Series(normalized_column(df, "country"), index=df.index)
+            var_num = as_integers(df["var."])
+            is_spain = countries.str.contains("spain|espanha")
+            mask = is_spain & var_num.notna()
+            # Real year is 1900 + var. (e.g., var. 77 → 1977)
+            df.loc[mask, "year"] = 1900 + var_num[mask].astype(int)
 
         # Identify key columns for grouping
         key_cols = ["country", "year", "denomination", "diameter, mm", "number"]
         key_cols = [c for c in key_cols if c in df.columns]
 
-        # Group and sum quantities
-        df_grouped = df.groupby(key_cols, dropna=False, as_index=False).agg(
-            {"quantity": "sum"}
-        )
-
-        # Add other columns that may exist (take first value)
-        for col in df.columns:
-            if col not in key_cols and col != "quantity":
-                df_temp = df.groupby(key_cols, dropna=False, as_index=False)[
-                    col
-                ].first()
-                df_grouped = df_grouped.merge(df_temp, on=key_cols, how="left")
-
-        return df_grouped
+        return sum_quantities(df, key_cols)
     else:  # numista
         # Identify key columns for grouping
         key_cols = [
@@ -360,24 +641,28 @@ def group_duplicate_coins(df, type):
         ]
         key_cols = [c for c in key_cols if c in df.columns]
 
-        # Group and sum quantities
-        df_grouped = df.groupby(key_cols, dropna=False, as_index=False).agg(
-            {"quantity": "sum"}
-        )
+        return sum_quantities(df, key_cols)
 
-        # Add other columns that may exist (take first value)
-        for col in df.columns:
-            if col not in key_cols and col != "quantity":
-                df_temp = df.groupby(key_cols, dropna=False, as_index=False)[
-                    col
-                ].first()
-                df_grouped = df_grouped.merge(df_temp, on=key_cols, how="left")
 
-        return df_grouped
+# Tables with at least this many rows are streamed as tab-separated text
+MAX_FORMATTED_ROWS = 50
+
+
+def print_table(df):
+    """
+    Print a table to stdout: aligned with to_string when small, otherwise written
+    row by row with to_csv (to_string builds the whole table as one string)
+    """
+    if len(df) < MAX_FORMATTED_ROWS:
+        print(df.to_string(index=True))
+    else:
+        df.to_csv(sys.stdout, sep="\t", index=True)
 
 
 def compare_coins(df1, df2, name1, name2):
     """Compare two coin DataFrames"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
     print(f"\n{'='*80}")
     print(f"COMPARISON BETWEEN {name1.upper()} AND {name2.upper()}")
     print(f"{'='*80}\n")
@@ -385,6 +670,8 @@ def compare_coins(df1, df2, name1, name2):
     # Normalize column names
     df1.columns = df1.columns.str.strip().str.lower()
     df2.columns = df2.columns.str.strip().str.lower()
+    df1 = to_categories(df1)
+    df2 = to_categories(df2)
 
     # Show basic information BEFORE grouping
     print(f"📊 {name1} (original):")
@@ -434,18 +721,30 @@ def compare_coins(df1, df2, name1, name2):
     print(f"   - {name2}: {int(total_qty_2)} coins")
     print(f"   - Difference: {int(total_qty_1 - total_qty_2)} coins\n")
 
+    # Normalize the matching attributes once; the frames keep them as columns
+    df1 = add_ucoin_match_columns(df1)
+    df2 = add_numista_match_columns(df2)
+
     # Perform approximate matching
     print("🔄 Matching coins between files (this may take a while)...")
     matches = approximate_match(df1, df2)
 
-    matched_idx1 = {m["idx_ucoin"] for m in matches}
-    matched_idx2 = {m["idx_numista"] for m in matches}
+    matched_idx1 = np.fromiter(
+        (m["idx_ucoin"] for m in matches), dtype=np.int64, count=len(matches)
+    )
+    matched_idx2 = np.fromiter(
+        (m["idx_numista"] for m in matches), dtype=np.int64, count=len(matches)
+    )
 
     print(f"✅ Found {len(matches)} matches between files\n")
 
     # Unmatched coins
-    unmatched_ucoin = df1[~df1.index.isin(matched_idx1)]
-    unmatched_numista = df2[~df2.index.isin(matched_idx2)]
+    unmatched1 = np.ones(len(df1), dtype=bool)
+    unmatched1[df1.index.get_indexer(matched_idx1)] = False
+    unmatched2 = np.ones(len(df2), dtype=bool)
+    unmatched2[df2.index.get_indexer(matched_idx2)] = False
+    unmatched_ucoin = df1.iloc[unmatched1]
+    unmatched_numista = df2.iloc[unmatched2]
 
     print(f"\n{'='*80}")
     print("UNMATCHED COINS")
@@ -459,60 +758,39 @@ def compare_coins(df1, df2, name1, name2):
     print("QUANTITY COMPARISON (MATCHED COINS)")
     print(f"{'='*80}\n")
 
-    differences = []
-    equal_qty = 0
-
-    for match in matches:
-        idx1 = match["idx_ucoin"]
-        idx2 = match["idx_numista"]
-
-        row1 = df1.loc[idx1]
-        row2 = df2.loc[idx2]
-
-        qty1 = row1.get("quantity", 0)
-        qty2 = row2.get("quantity", 0)
-
-        if qty1 != qty2:
-            # Extract Numista number and construct link
-            numista_num = row2.get("n# number (with link)", "")
-            link_numista = ""
-            if pd.notna(numista_num) and str(numista_num).strip():
-                import re
-
-                # Extract only digits from the string
-                num_str = re.sub(r"\D", "", str(numista_num))
-                if num_str:
-                    link_numista = f"https://pt.numista.com/{num_str}"
-
-            differences.append(
-                {
-                    "country/issuer": row1.get("country", ""),
-                    "year": row1.get("year", ""),
-                    "denomination": row1.get("denomination", ""),
-                    "ref_ucoin": row1.get("number", ""),
-                    "ref_numista": row2.get("reference", ""),
-                    "qty_ucoin": int(qty1) if pd.notna(qty1) else 0,
-                    "qty_numista": int(qty2) if pd.notna(qty2) else 0,
-                    "difference": (
-                        int(qty1 - qty2) if pd.notna(qty1) and pd.notna(qty2) else 0
-                    ),
-                    "link_numista": link_numista,
-                }
-            )
-        else:
-            equal_qty += 1
+    # Take the matched rows of both files at once, by position
+    pos1 = df1.index.get_indexer(matched_idx1)
+    pos2 = df2.index.get_indexer(matched_idx2)
+    matched1 = df1.iloc[pos1].reset_index(drop=True)
+    matched2 = df2.iloc[pos2].reset_index(drop=True)
+
+    qty1 = get_column(matched1, "quantity")
+    qty2 = get_column(matched2, "quantity")
+    with_difference = (qty1 != qty2).to_numpy()
+    equal_qty = int((~with_difference).sum())
+
+    df_diff = pd.DataFrame(
+        {
+            "country/issuer": get_column(matched1, "country"),
+            "year": get_column(matched1, "year"),
+            "denomination": get_column(matched1, "denomination"),
+            "ref_ucoin": get_column(matched1, "number"),
+            "ref_numista": get_column(matched2, "reference"),
+            "qty_ucoin": qty1.fillna(0).astype(int),
+            "qty_numista": qty2.fillna(0).astype(int),
+            "difference": (qty1 - qty2).fillna(0).astype(int),
+            "link_numista": numista_links(
+                get_column(matched2, "n# number (with link)")
+            ),
+        }
+    )
+    df_diff = df_diff[with_difference].reset_index(drop=True)
 
-    if differences:
-        print(f"⚠️  Quantity differences: {len(differences)}")
+    if len(df_diff) > 0:
+        print(f"⚠️  Quantity differences: {len(df_diff)}")
         print(f"✅ Equal quantities: {equal_qty}\n")
 
-        df_diff = pd.DataFrame(differences)
-        print(df_diff.to_string(index=True))
-
-        # Export to Excel with hyperlinks
-        filename = f"differences_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        write_excel_with_hyperlinks(df_diff, filename, "link_numista")
-        print(f"\n💾 Differences saved to: {filename}")
+        print_table(df_diff)
     else:
         print(f"✅ All {len(matches)} matched coins have equal quantities!")
 
@@ -530,8 +808,8 @@ def compare_coins(df1, df2, name1, name2):
     )
 
     # Differences in matched coins
-    positive_diffs = sum(d["difference"] for d in differences if d["difference"] > 0)
-    negative_diffs = sum(d["difference"] for d in differences if d["difference"] < 0)
+    positive_diffs = df_diff.loc[df_diff["difference"] > 0, "difference"].sum()
+    negative_diffs = df_diff.loc[df_diff["difference"] < 0, "difference"].sum()
 
     print("📊 Contributions to total difference:\n")
     print(f"   Unmatched coins:")
@@ -561,9 +839,9 @@ def compare_coins(df1, df2, name1, name2):
     if abs(positive_diffs + negative_diffs) <= 5:
         print("🔍 The difference comes from different quantities in matched coins:\n")
         relevant_coins = sorted(
-            differences, key=lambda x: abs(x["difference"]), reverse=True
+            df_diff.to_dict("records"), key=lambda x: abs(x["difference"]), reverse=True
         )[:10]
-        df_rel = pd.DataFrame(relevant_coins)
+        df_rel = pd.DataFrame(relevant_coins, columns=df_diff.columns)
         print(
             df_rel[
                 [
@@ -580,8 +858,8 @@ def compare_coins(df1, df2, name1, name2):
         )
 
     # List all positive differences (coins missing in numista)
-    coins_missing_numista = [d for d in differences if d["difference"] > 0]
-    coins_extra_numista = [d for d in differences if d["difference"] < 0]
+    coins_missing_numista = df_diff[df_diff["difference"] > 0]
+    coins_extra_numista = df_diff[df_diff["difference"] < 0]
 
     print(f"\n\n📋 COMPLETE SUMMARY:\n")
     print(
@@ -592,59 +870,33 @@ def compare_coins(df1, df2, name1, name2):
     )
     print(f"   • Net balance: {int(positive_diffs + negative_diffs)} coins")
 
-    if coins_missing_numista:
-        # Save only those missing
-        filename_missing = (
-            f"missing_in_numista_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        )
-        df_missing = pd.DataFrame(coins_missing_numista)
-        write_excel_with_hyperlinks(df_missing, filename_missing, "link_numista")
-        print(f"\n💾 Coins with more quantity in uCoin: {filename_missing}")
-
-    # Export unmatched coins
-    if len(unmatched_ucoin) > 0 or len(unmatched_numista) > 0:
-        filename2 = f"unmatched_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-        # Add link column to unmatched numista
-        if len(unmatched_numista) > 0:
-            import re
-
-            unmatched_numista_copy = unmatched_numista.copy()
-            unmatched_numista_copy["link_numista"] = unmatched_numista_copy.apply(
-                lambda row: (
-                    f"https://pt.numista.com/{re.sub(r'\D', '', str(row.get('n# number (with link)', '')))}"
-                    if pd.notna(row.get("n# number (with link)", ""))
-                    and re.sub(r"\D", "", str(row.get("n# number (with link)", "")))
-                    else ""
-                ),
-                axis=1,
+    # Export all results to a single Excel workbook
+    sheets = {}
+    if len(df_diff) > 0:
+        sheets["Differences"] = df_diff
+    if len(coins_missing_numista) > 0:
+        sheets["Missing_in_Numista"] = coins_missing_numista
+    if len(unmatched_ucoin) > 0:
+        sheets["Only_uCoin"] = unmatched_ucoin[
+            ["country", "year", "denomination", "number", "quantity"]
+        ]
+    if len(unmatched_numista) > 0:
+        sheets["Only_Numista"] = unmatched_numista[
+            ["issuer", "year", "title", "reference", "quantity"]
+        ].assign(
+            link_numista=numista_links(
+                get_column(unmatched_numista, "n# number (with link)")
             )
+        )
 
-        with pd.ExcelWriter(filename2, engine="openpyxl") as writer:
-            if len(unmatched_ucoin) > 0:
-                unmatched_ucoin[
-                    ["country", "year", "denomination", "number", "quantity"]
-                ].to_excel(writer, sheet_name="Only_uCoin", index=False)
-            if len(unmatched_numista) > 0:
-                unmatched_numista_copy[
-                    ["issuer", "year", "title", "reference", "quantity", "link_numista"]
-                ].to_excel(writer, sheet_name="Only_Numista", index=False)
-
-        # Add hyperlinks to Only_Numista sheet
-        if len(unmatched_numista) > 0:
-            wb = load_workbook(filename2)
-            if "Only_Numista" in wb.sheetnames:
-                ws = wb["Only_Numista"]
-                # Find link_numista column (should be column F - the 6th column)
-                for row in range(2, ws.max_row + 1):
-                    cell = ws.cell(row=row, column=6)  # Column F
-                    if cell.value and str(cell.value).startswith("http"):
-                        url = str(cell.value)
-                        cell.hyperlink = url
-                        cell.style = "Hyperlink"
-                wb.save(filename2)
-
-        print(f"💾 Unmatched coins saved to: {filename2}")
+    if sheets:
+        filename = f"comparison_{timestamp}.xlsx"
+        # xlsxwriter turns the URLs into hyperlinks as it writes the cells
+        with pd.ExcelWriter(filename, engine="xlsxwriter") as writer:
+            for sheet_name, df_sheet in sheets.items():
+                df_sheet.to_excel(writer, sheet_name=sheet_name, index=False)
+        print(f"\n💾 Results saved to: {filename}")
+        print(f"   Sheets: {', '.join(sheets)}")
 
 
 def main():
@@ -654,8 +906,8 @@ def main():
     print("🔄 Loading Excel files...")
 
     # Load files
-    df_ucoin = load_excel(file1)
-    df_numista = load_excel(file2)
+    df_ucoin = load_excel(file1, UCOIN_COLUMNS)
+    df_numista = load_excel(file2, NUMISTA_COLUMNS)
 
     # Compare
     compare_coins(df_ucoin, df_numista, "ucoin", "numista")